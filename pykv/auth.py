@@ -5,10 +5,17 @@
 # 3) Storing user details in data/users.json
 # ================================================================
 
-import json      # Used to store user info in JSON file
 import os        # Used for file/directory operations
-import hashlib   # Used to hash passwords for security
+import hashlib   # Used to recognise legacy SHA256 password hashes
+import hmac      # Used for constant-time comparison of legacy hashes
 import re        # Used for email validation using regex
+import secrets   # Used to create the verdict cache secret
+import threading # Used to protect the verdict cache
+
+import orjson                                      # Fast JSON for users.json
+from cachetools import TTLCache                    # Bounded cache with expiry
+from argon2 import PasswordHasher                  # Salted Argon2id hashing
+from argon2.exceptions import VerificationError, InvalidHashError
 
 # File path where users will be stored
 USERS_FILE = "data/users.json"
@@ -16,21 +23,65 @@ USERS_FILE = "data/users.json"
 # Regex pattern to validate a proper email address
 EMAIL_PATTERN = r"^[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}$"
 
+# Compiled once at import so is_valid_email does not look it up each call
+_EMAIL_RE = re.compile(EMAIL_PATTERN)
+
+# Longest email address allowed (RFC 5321 path limit)
+MAX_EMAIL_LENGTH = 254
+
+# Argon2id hasher (OWASP recommended parameters)
+# Every hash gets its own random salt, embedded in the hash string
+_hasher = PasswordHasher(time_cost=2, memory_cost=46 * 1024, parallelism=1)
+
+# Cache of recent login verdicts so the slow Argon2 check runs only once
+# per (user, password) every 5 minutes.
+# Keys are HMAC digests (never plain passwords), values are True/False.
+_VERIFY_SECRET = secrets.token_bytes(32)
+_verify_cache = TTLCache(maxsize=1024, ttl=300)
+_verify_lock = threading.Lock()
+
+# In-memory copy of users.json, keyed on the file's (mtime, size)
+# (re-entrant so one update can load + save while holding it)
+_users_cache = {"version": None, "data": None}
+_users_lock = threading.RLock()
+
 
 def _hash_password(password: str) -> str:
     """
-    Converts a plain password string into a SHA256 hashed string
+    Converts a plain password string into a salted Argon2id hash string
+    """
+    # Result looks like: $argon2id$v=19$m=47104,t=2,p=1$<salt>$<hash>
+    return _hasher.hash(password)
+
+
+def _legacy_hash_password(password: str) -> str:
+    """
+    Old unsalted SHA256 hash (only used to migrate old user records)
     """
-    # Convert password to bytes -> hash -> return hex string
     return hashlib.sha256(password.encode()).hexdigest()
 
 
+def _verify_key(username: str, password: str) -> bytes:
+    """
+    Builds the verdict cache key for a (username, password) pair
+    """
+    message = f"{username}\0{password}".encode()
+    return hmac.new(_VERIFY_SECRET, message, "sha256").digest()
+
+
 def is_valid_email(email: str) -> bool:
     """
     Checks whether input is a proper email address
     """
-    # re.match returns match object if pattern matches else None
-    return re.match(EMAIL_PATTERN, email) is not None
+    # Cheap string checks first, so obviously invalid input never
+    # reaches the regex: length limit, exactly one "@", "." in domain
+    if len(email) > MAX_EMAIL_LENGTH or email.count("@") != 1:
+        return False
+    if "." not in email.rsplit("@", 1)[1]:
+        return False
+
+    # match returns match object if pattern matches else None
+    return _EMAIL_RE.match(email) is not None
 
 
 def is_valid_password(password: str) -> bool:
@@ -46,31 +97,75 @@ def is_valid_password(password: str) -> bool:
     return True
 
 
-def load_users() -> dict:
+def _ensure_users_file() -> None:
     """
-    Loads users from users.json
-    If file does not exist -> create it
+    Creates data folder and an empty users.json if they are missing
     """
     # Ensure "data" folder exists
-    os.makedirs("data", exist_ok=True)
+    os.makedirs(os.path.dirname(USERS_FILE), exist_ok=True)
 
     # If users.json is not there, create a blank JSON object file
     if not os.path.exists(USERS_FILE):
-        with open(USERS_FILE, "w") as f:
-            json.dump({}, f)
+        with open(USERS_FILE, "wb") as f:
+            f.write(b"{}")
+
+
+def load_users() -> dict:
+    """
+    Loads users from users.json
+    The parsed file is cached and only re-read when it changes on disk
+    """
+    with _users_lock:
+        try:
+            st = os.stat(USERS_FILE)
+        except FileNotFoundError:
+            # File was removed while running -> recreate it
+            _ensure_users_file()
+            st = os.stat(USERS_FILE)
+
+        # Re-read users.json only if it was modified since last load
+        version = (st.st_mtime_ns, st.st_size)
+        if _users_cache["version"] != version:
+            with open(USERS_FILE, "rb") as f:
+                _users_cache["data"] = orjson.loads(f.read())
+            _users_cache["version"] = version
 
-    # Read users.json and return dictionary
-    with open(USERS_FILE, "r") as f:
-        return json.load(f)
+        # Return a copy so callers can modify it safely
+        return dict(_users_cache["data"])
 
 
 def save_users(users: dict) -> None:
     """
     Saves users dict back into users.json
     """
-    # Open file in write mode and dump formatted JSON
-    with open(USERS_FILE, "w") as f:
-        json.dump(users, f, indent=2)
+    # Write compact JSON to a temp file first, then swap it in, so a
+    # crash mid-write never leaves a half written users.json
+    data = orjson.dumps(users)
+    tmp_path = USERS_FILE + ".tmp"
+
+    with _users_lock:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, USERS_FILE)
+
+        # Keep cache in sync so the next load does not re-read the file
+        st = os.stat(USERS_FILE)
+        _users_cache["data"] = dict(users)
+        _users_cache["version"] = (st.st_mtime_ns, st.st_size)
+
+
+def _update_user(username: str, record: dict) -> None:
+    """
+    Stores one user record: load + assign + save under the users lock,
+    so a concurrent registration is never overwritten by a stale copy.
+    Slow work (hashing) must be done before calling this.
+    """
+    with _users_lock:
+        users = load_users()
+        users[username] = record
+        save_users(users)
 
 
 def register_user(username: str, password: str):
@@ -80,9 +175,6 @@ def register_user(username: str, password: str):
         (True, "success message") if OK
         (False, "error message") if not OK
     """
-    # Load existing users from file
-    users = load_users()
-
     # Restriction 1: username must be valid email
     if not is_valid_email(username):
         return False, "Enter a valid email address"
@@ -92,14 +184,26 @@ def register_user(username: str, password: str):
         return False, "Password must be at least 8 characters"
 
     # Restriction 3: cannot register same email twice
-    if username in users:
+    # (cheap early check before spending time on hashing)
+    if username in load_users():
         return False, "User already exists"
 
     # Store hashed password (not plain password)
-    users[username] = _hash_password(password)
+    record = {"hash": _hash_password(password)}
+
+    # Check again and save under the lock (another request may have
+    # registered the same email while we were hashing)
+    with _users_lock:
+        users = load_users()
+        if username in users:
+            return False, "User already exists"
+
+        users[username] = record
+        save_users(users)
 
-    # Save updated user database
-    save_users(users)
+    # Forget cached verdicts (e.g. failed logins before registration)
+    with _verify_lock:
+        _verify_cache.clear()
 
     # Return success
     return True, "Registration successful"
@@ -110,6 +214,26 @@ def validate_user(username: str, password: str) -> bool:
     Validates login credentials.
     Returns True if valid.
     """
+    key = _verify_key(username, password)
+
+    # Return cached verdict if we checked these credentials recently
+    with _verify_lock:
+        verdict = _verify_cache.get(key)
+    if verdict is not None:
+        return verdict
+
+    # Slow path: check against users.json and remember the result
+    verdict = _verify_credentials(username, password)
+    with _verify_lock:
+        _verify_cache[key] = verdict
+
+    return verdict
+
+
+def _verify_credentials(username: str, password: str) -> bool:
+    """
+    Checks credentials against the stored password hash (uncached)
+    """
     # Load existing users from JSON
     users = load_users()
 
@@ -121,5 +245,30 @@ def validate_user(username: str, password: str) -> bool:
     if username not in users:
         return False
 
-    # Convert login password to hash and compare with stored hash
-    return users[username] == _hash_password(password)
+    record = users[username]
+
+    # Old records are plain SHA256 hex strings -> verify and migrate
+    if isinstance(record, str):
+        if not hmac.compare_digest(record, _legacy_hash_password(password)):
+            return False
+
+        # Password is correct: upgrade record to Argon2id
+        _update_user(username, {"hash": _hash_password(password)})
+        return True
+
+    # Verify login password against stored Argon2id hash
+    stored_hash = record["hash"]
+    try:
+        _hasher.verify(stored_hash, password)
+    except (VerificationError, InvalidHashError):
+        return False
+
+    # Re-hash if hasher parameters changed since the hash was created
+    if _hasher.check_needs_rehash(stored_hash):
+        _update_user(username, {"hash": _hash_password(password)})
+
+    return True
+
+
+# Create users.json once at import time instead of on every load
+_ensure_users_file()
@@ -7,27 +7,66 @@
 # - Replication foundation
 # ================================================================
 
+import asyncio
+import logging
 import os
-import requests
+import queue
+import threading
+from concurrent.futures import Future
+from contextlib import asynccontextmanager
+from typing import Annotated, Any, Literal, Union
+
+import httpx
+import msgspec
 
 from fastapi import FastAPI, Request, Form, HTTPException
-from fastapi.responses import RedirectResponse, HTMLResponse, JSONResponse
+from fastapi.responses import RedirectResponse, HTMLResponse, JSONResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
-from starlette.middleware.sessions import SessionMiddleware
 from fastapi.templating import Jinja2Templates
 
-from store import PyKVStore
+from store import PyKVStore, MAX_TTL_SECONDS
 from persistence import WAL
 from auth import register_user, validate_user
+from session import CachedSessionMiddleware
 
 
 ROLE = os.getenv("ROLE", "primary")
 SECONDARY_URL = os.getenv("SECONDARY_URL")
 
-app = FastAPI(title="PyKV", version="2.0")
+# Session signing key (set a new one on deploy to log everyone out)
+SECRET_KEY = os.getenv("SECRET_KEY", "pykv-secret-key")
+
+
+class PyKVJSONResponse(ORJSONResponse):
+    """
+    orjson (C) response that falls back to stdlib json for the rare
+    content orjson refuses (e.g. ints wider than 64 bits)
+    """
+    def render(self, content) -> bytes:
+        try:
+            return super().render(content)
+        except TypeError:   # orjson.JSONEncodeError is a TypeError
+            return JSONResponse.render(self, content)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # nothing to start: store, WAL and background threads are created
+    # at import time below
+    yield
+
+    # flush buffered WAL records to disk before exit
+    wal.close()
+
+    if repl_client is not None:
+        repl_client.close()
 
-# session middleware
-app.add_middleware(SessionMiddleware, secret_key="pykv-secret-key")
+
+# orjson instead of stdlib json for every JSON response
+app = FastAPI(title="PyKV", version="2.0", default_response_class=PyKVJSONResponse, lifespan=lifespan)
+
+# session middleware (signed cookies, verified cookies are cached)
+app.add_middleware(CachedSessionMiddleware, secret_key=SECRET_KEY)
 
 # templates + static
 templates = Jinja2Templates(directory="templates")
@@ -39,6 +78,172 @@ wal = WAL("data/pykv.log")
 wal.recover(store)
 
 
+# -------------------- WAL GROUP COMMIT --------------------
+# Requests queue their WAL records and await; one background thread writes
+# everything queued so far with one append_batch + fsync (group commit).
+# Records that arrive during an fsync are picked up by the next batch.
+
+COMMIT_MAX_BATCH = 512   # max requests written per batch
+
+commit_queue = queue.SimpleQueue()
+
+
+def _commit_loop():
+    while True:
+        # wait for the first request, then take whatever else is queued
+        batch = [commit_queue.get()]
+        while len(batch) < COMMIT_MAX_BATCH:
+            try:
+                batch.append(commit_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        records = [record for recs, _ in batch for record in recs]
+        try:
+            wal.append_batch(records)
+            wal.flush(fsync=True)
+        except Exception as exc:
+            for _, done in batch:
+                done.set_exception(exc)
+        else:
+            for _, done in batch:
+                done.set_result(None)
+
+
+async def wal_commit(*records):
+    """
+    Queues WAL records and waits until they are written and synced
+    (the event loop keeps serving other requests meanwhile)
+    """
+    done = Future()
+    commit_queue.put((records, done))
+    await asyncio.wrap_future(done)
+
+
+commit_thread = threading.Thread(target=_commit_loop, daemon=True)
+commit_thread.start()
+
+
+# -------------------- REPLICATION SENDER --------------------
+# Primary does not call the secondary inside the request. Ops are queued
+# and one background thread sends them in order as /replica/batch calls
+# over a pooled keep-alive connection (best effort: failed batches and
+# ops that do not fit in the queue are logged and dropped).
+
+REPL_MAX_BATCH = 256      # max ops sent per batch
+REPL_QUEUE_MAX = 10000    # max ops waiting (bounds memory if secondary is slow)
+
+logger = logging.getLogger("pykv.replication")
+
+repl_queue = queue.Queue(maxsize=REPL_QUEUE_MAX)
+repl_dropped = 0          # ops dropped because the queue was full
+repl_client = None
+
+if ROLE == "primary" and SECONDARY_URL:
+    repl_client = httpx.Client(
+        base_url=SECONDARY_URL,
+        timeout=2.0,
+        limits=httpx.Limits(max_keepalive_connections=8),
+    )
+
+
+def _replication_loop():
+    while True:
+        # wait for the first op, then take whatever else is queued
+        ops = [repl_queue.get()]
+        while len(ops) < REPL_MAX_BATCH:
+            try:
+                ops.append(repl_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        try:
+            response = repl_client.post("/replica/batch", json={"ops": ops})
+            response.raise_for_status()
+        except Exception as exc:
+            logger.warning("replication batch of %d ops failed: %s", len(ops), exc)
+
+
+def replicate(op: dict):
+    """
+    Queues an op for the secondary (no-op if replication is off).
+    Never blocks: if the queue is full the op is dropped and counted.
+    """
+    global repl_dropped
+
+    if repl_client is None:
+        return
+
+    try:
+        repl_queue.put_nowait(op)
+    except queue.Full:
+        repl_dropped += 1
+
+        # log first drop and then every 1000th, not every request
+        if repl_dropped % 1000 == 1:
+            logger.warning("replication queue full, %d ops dropped so far", repl_dropped)
+
+
+if repl_client is not None:
+    repl_thread = threading.Thread(target=_replication_loop, daemon=True)
+    repl_thread.start()
+
+
+# -------------------- REQUEST BODIES --------------------
+# Small, frequent JSON bodies are decoded by msgspec straight into
+# structs instead of going through FastAPI's dict/pydantic parsing.
+
+# TTL in seconds, int or float, at most MAX_TTL_SECONDS (else 400)
+TTLSeconds = Union[
+    Annotated[int, msgspec.Meta(le=MAX_TTL_SECONDS)],
+    Annotated[float, msgspec.Meta(le=MAX_TTL_SECONDS)],
+    None,
+]
+
+
+class SetReq(msgspec.Struct):
+    key: str
+    value: Any = None
+    ttl: TTLSeconds = None
+
+
+class BatchOp(msgspec.Struct):
+    op: Literal["set", "delete"]
+    key: str
+    value: Any = None
+    ttl: TTLSeconds = None
+
+
+class BatchReq(msgspec.Struct):
+    ops: list[BatchOp]
+
+
+set_decoder = msgspec.json.Decoder(SetReq)
+batch_decoder = msgspec.json.Decoder(BatchReq)
+
+
+async def decode_body(request: Request, decoder):
+    """
+    Decodes request JSON body with a msgspec decoder (400 if invalid)
+    """
+    try:
+        return decoder.decode(await request.body())
+    except msgspec.DecodeError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+
+def encode_record(encode, *args):
+    """
+    Builds a WAL record before the store is changed, so a value the WAL
+    cannot hold (e.g. an int wider than 64 bits) is rejected with 400
+    instead of ending up in memory only
+    """
+    try:
+        return encode(*args)
+    except (OverflowError, TypeError, ValueError) as exc:
+        raise HTTPException(status_code=400, detail=f"value cannot be stored: {exc}")
+
+
 def require_login(request: Request):
     if not request.session.get("user"):
         raise HTTPException(status_code=401, detail="Login required")
@@ -47,7 +252,7 @@ def require_login(request: Request):
 # -------------------- UI ROUTES --------------------
 
 @app.get("/", response_class=HTMLResponse)
-def dashboard(request: Request):
+async def dashboard(request: Request):
     if not request.session.get("user"):
         return RedirectResponse("/login", status_code=302)
 
@@ -55,13 +260,14 @@ def dashboard(request: Request):
 
 
 @app.get("/login", response_class=HTMLResponse)
-def login_page(request: Request):
+async def login_page(request: Request):
     return templates.TemplateResponse("login.html", {"request": request})
 
 
 @app.post("/login")
-def login(request: Request, username: str = Form(...), password: str = Form(...)):
-    if not validate_user(username, password):
+async def login(request: Request, username: str = Form(...), password: str = Form(...)):
+    # Argon2 check is slow CPU work -> run it off the event loop
+    if not await asyncio.to_thread(validate_user, username, password):
         return templates.TemplateResponse("login.html", {"request": request, "error": "Invalid email or password"})
 
     request.session["user"] = username
@@ -69,13 +275,13 @@ def login(request: Request, username: str = Form(...), password: str = Form(...)
 
 
 @app.get("/register", response_class=HTMLResponse)
-def register_page(request: Request):
+async def register_page(request: Request):
     return templates.TemplateResponse("register.html", {"request": request})
 
 
 @app.post("/register")
-def register(request: Request, username: str = Form(...), password: str = Form(...)):
-    ok, msg = register_user(username, password)
+async def register(request: Request, username: str = Form(...), password: str = Form(...)):
+    ok, msg = await asyncio.to_thread(register_user, username, password)
 
     if not ok:
         return templates.TemplateResponse("register.html", {"request": request, "error": msg})
@@ -84,13 +290,13 @@ def register(request: Request, username: str = Form(...), password: str = Form(.
 
 
 @app.get("/logout")
-def logout(request: Request):
+async def logout(request: Request):
     request.session.clear()
     return RedirectResponse("/login", status_code=302)
 
 
 @app.get("/stats-ui", response_class=HTMLResponse)
-def stats_ui(request: Request):
+async def stats_ui(request: Request):
     require_login(request)
     return templates.TemplateResponse("stats.html", {"request": request})
 
@@ -98,42 +304,40 @@ def stats_ui(request: Request):
 # -------------------- API ROUTES --------------------
 
 @app.post("/set")
-def api_set(request: Request, payload: dict):
+async def api_set(request: Request):
     require_login(request)
 
-    key = payload.get("key")
-    value = payload.get("value")
-    ttl = payload.get("ttl")
+    req = await decode_body(request, set_decoder)
+    key, value, ttl = req.key, req.value, req.ttl
 
     if not key:
         raise HTTPException(status_code=400, detail="key is required")
 
+    record = encode_record(wal.encode_set, key, value, ttl)
     store.set(key, value, ttl=ttl)
-    wal.append_set(key, value, ttl)
+    await wal_commit(record)
 
     # replication
-    if ROLE == "primary" and SECONDARY_URL:
-        try:
-            requests.post(f"{SECONDARY_URL}/replica/set", json={"key": key, "value": value, "ttl": ttl}, timeout=2)
-        except Exception:
-            pass
+    replicate({"op": "set", "key": key, "value": value, "ttl": ttl})
 
     return {"message": "SET ok", "key": key}
 
 
 @app.get("/get/{key}")
-def api_get(request: Request, key: str):
+async def api_get(request: Request, key: str):
     require_login(request)
 
-    value = store.get(key)
-    if value is None:
+    # value + TTL in one store call
+    found, value, ttl_remaining = store.get_with_ttl(key)
+    if not found:
         raise HTTPException(status_code=404, detail="Key not found")
 
-    return {"key": key, "value": value, "ttl_remaining": store.ttl_remaining(key)}
+    # return response directly (skips FastAPI's jsonable_encoder pass)
+    return PyKVJSONResponse({"key": key, "value": value, "ttl_remaining": ttl_remaining})
 
 
 @app.delete("/delete/{key}")
-def api_delete(request: Request, key: str):
+async def api_delete(request: Request, key: str):
     require_login(request)
 
     ok = store.delete(key)
@@ -141,78 +345,107 @@ def api_delete(request: Request, key: str):
     if not ok:
         raise HTTPException(status_code=404, detail="Key not found")
 
-    wal.append_delete(key)
+    await wal_commit(wal.encode_delete(key))
 
     # replication
-    if ROLE == "primary" and SECONDARY_URL:
-        try:
-            requests.delete(f"{SECONDARY_URL}/replica/delete/{key}", timeout=2)
-        except Exception:
-            pass
+    replicate({"op": "delete", "key": key})
 
     return {"message": "DELETE ok", "key": key}
 
 
 @app.get("/keys")
-def api_keys(request: Request):
+async def api_keys(request: Request):
     """
     Returns all keys in store (for frontend display)
     """
     require_login(request)
-    return {"keys": store.keys(), "count": len(store.keys())}
+    keys = store.keys()
+    return {"keys": keys, "count": len(keys)}
 
 
 @app.delete("/clear")
-def api_clear(request: Request):
+async def api_clear(request: Request):
     """
     Deletes all keys from store (frontend clear button)
     """
     require_login(request)
 
-    # delete all keys one by one so LRU stays consistent
-    for k in store.keys():
-        store.delete(k)
-        wal.append_delete(k)
+    # drop everything at once + single CLEAR record in WAL
+    store.clear_all()
+    await wal_commit(wal.encode_clear())
 
     return {"message": "All keys cleared"}
 
 
 @app.get("/stats")
-def api_stats(request: Request):
+async def api_stats(request: Request):
     require_login(request)
-    return store.stats(wal_size=wal.size())
+    # WAL lock may be held by an fsync or compaction -> wait off the loop
+    wal_size = await asyncio.to_thread(wal.size)
+    return store.stats(wal_size=wal_size)
 
 
 @app.post("/compact")
-def compact_wal(request: Request):
+async def compact_wal(request: Request):
     require_login(request)
-    wal.compact(store)
+    await asyncio.to_thread(wal.compact, store)
     return {"message": "WAL compacted successfully"}
 
 
 # -------------------- REPLICATION ENDPOINTS --------------------
 
 @app.post("/replica/set")
-def replica_set(payload: dict):
+async def replica_set(request: Request):
     if ROLE != "secondary":
-        return JSONResponse({"error": "Not a secondary node"}, status_code=400)
+        return PyKVJSONResponse({"error": "Not a secondary node"}, status_code=400)
 
-    key = payload.get("key")
-    value = payload.get("value")
-    ttl = payload.get("ttl")
+    req = await decode_body(request, set_decoder)
+    key, value, ttl = req.key, req.value, req.ttl
 
+    record = encode_record(wal.encode_set, key, value, ttl)
     store.set(key, value, ttl=ttl)
-    wal.append_set(key, value, ttl)
+    await wal_commit(record)
 
     return {"message": "replicated set ok"}
 
 
 @app.delete("/replica/delete/{key}")
-def replica_delete(key: str):
+async def replica_delete(key: str):
     if ROLE != "secondary":
-        return JSONResponse({"error": "Not a secondary node"}, status_code=400)
+        return PyKVJSONResponse({"error": "Not a secondary node"}, status_code=400)
 
     store.delete(key)
-    wal.append_delete(key)
+    await wal_commit(wal.encode_delete(key))
 
     return {"message": "replicated delete ok"}
+
+
+@app.post("/replica/batch")
+async def replica_batch(request: Request):
+    """
+    Applies a batch of ops from the primary, in order
+    """
+    if ROLE != "secondary":
+        return PyKVJSONResponse({"error": "Not a secondary node"}, status_code=400)
+
+    # decode + encode every op first, so a bad op rejects the batch
+    # (400) before anything is applied
+    req = await decode_body(request, batch_decoder)
+
+    records = []
+    for op in req.ops:
+        if op.op == "set":
+            records.append(encode_record(wal.encode_set, op.key, op.value, op.ttl))
+        else:
+            records.append(encode_record(wal.encode_delete, op.key))
+
+    for op in req.ops:
+        if op.op == "set":
+            store.set(op.key, op.value, ttl=op.ttl)
+        else:
+            store.delete(op.key)
+
+    # whole batch in one WAL commit
+    await wal_commit(*records)
+
+    return {"message": "replicated batch ok", "count": len(records)}
@@ -3,10 +3,99 @@
 # WAL stores all operations:
 # - SET
 # - DEL
+# - CLEAR
 # So after crash/restart, data can be recovered.
+#
+# Record format (binary, one frame per operation):
+#   [4 bytes payload length][4 bytes CRC32C of payload][msgpack payload]
+# Payload is ("SET", key, value, ttl), ("DEL", key) or ("CLEAR",).
+#
+# compact() writes the live keys into a gzip snapshot (pykv.log.gz)
+# and empties the log, so recovery = snapshot + log written after it.
 # ======================================================================
 
-import os   # Used for managing files and directories
+import gzip        # Used to compress WAL snapshots
+import mmap        # Used to read the WAL file without copying it
+import os          # Used for managing files and directories
+import struct      # Used to pack frame headers
+import threading   # Used to protect the shared WAL file handle
+
+import msgpack                 # Fast binary serialization of records
+from crc32c import crc32c      # Hardware accelerated checksum
+
+# Size of the in-memory write buffer in front of the WAL file
+WAL_BUFFER_SIZE = 64 * 1024
+
+# Frame header: little-endian payload length + CRC32C checksum
+FRAME_HEADER = struct.Struct("<II")
+
+# Old text WAL files start with one of these
+LEGACY_PREFIXES = (b"SET|", b"DEL|")
+
+# First two bytes of every gzip file
+GZIP_MAGIC = b"\x1f\x8b"
+
+# Fastest gzip level: WAL is limited by disk bytes, not CPU
+SNAPSHOT_COMPRESSLEVEL = 1
+
+
+def _frame(record):
+    """
+    Serializes one record and wraps it in a length + checksum header.
+    """
+    payload = msgpack.packb(record)
+    return FRAME_HEADER.pack(len(payload), crc32c(payload)) + payload
+
+
+def _iter_frames(buf):
+    """
+    Yields (record, end_offset) for every valid frame in buf.
+    Stops at the first torn or corrupted frame.
+    """
+    pos = 0
+    size = len(buf)
+
+    while pos + FRAME_HEADER.size <= size:
+        length, checksum = FRAME_HEADER.unpack_from(buf, pos)
+        start = pos + FRAME_HEADER.size
+        end = start + length
+
+        # Frame cut short (crash during write)
+        if end > size:
+            return
+
+        payload = buf[start:end]
+
+        # Frame damaged
+        if crc32c(payload) != checksum:
+            return
+
+        yield msgpack.unpackb(payload), end
+        pos = end
+
+
+def _replay(buf, entries):
+    """
+    Applies every valid frame in buf to entries (key -> (value, ttl)).
+    Returns offset just after the last valid frame.
+    """
+    valid_end = 0
+    for record, valid_end in _iter_frames(buf):
+        # SET recovery (re-insert so dict order = most recent write last)
+        if record[0] == "SET":
+            _, key, value, ttl = record
+            entries.pop(key, None)
+            entries[key] = (value, ttl)
+
+        # DELETE recovery
+        elif record[0] == "DEL":
+            entries.pop(record[1], None)
+
+        # CLEAR recovery: everything written before is gone
+        elif record[0] == "CLEAR":
+            entries.clear()
+
+    return valid_end
 
 
 class WAL:
@@ -15,6 +104,7 @@ class WAL:
     """
     def __init__(self, log_path="data/pykv.log"):
         self.log_path = log_path  # Store path of WAL file
+        self.snapshot_path = log_path + ".gz"  # Compacted snapshot path
 
         # Ensure folder exists (create if missing)
         os.makedirs(os.path.dirname(log_path), exist_ok=True)
@@ -23,38 +113,179 @@ class WAL:
         if not os.path.exists(self.log_path):
             open(self.log_path, "w").close()
 
+        # Keep one buffered handle open instead of reopening per write
+        self._lock = threading.Lock()
+        self._f = self._open()
+
+        # Snapshot size is only changed by compact(), so remember it
+        self._snapshot_size = 0
+        if os.path.exists(self.snapshot_path):
+            self._snapshot_size = os.path.getsize(self.snapshot_path)
+
+    def _open(self):
+        """
+        Opens WAL file for buffered appending.
+        """
+        return open(self.log_path, "ab", buffering=WAL_BUFFER_SIZE)
+
+    def encode_set(self, key, value, ttl):
+        """
+        Builds a framed SET record.
+        """
+        return _frame(("SET", key, value, ttl))
+
+    def encode_delete(self, key):
+        """
+        Builds a framed DEL record.
+        """
+        return _frame(("DEL", key))
+
+    def encode_clear(self):
+        """
+        Builds a framed CLEAR record.
+        """
+        return _frame(("CLEAR",))
+
     def append_set(self, key, value, ttl):
         """
-        Writes SET operation to WAL file.
-        Format:
-            SET|key|value|ttl
+        Writes SET operation to WAL buffer.
         """
-        with open(self.log_path, "a", encoding="utf-8") as f:
-            f.write(f"SET|{key}|{value}|{ttl}\n")   # append to WAL
+        with self._lock:
+            self._f.write(self.encode_set(key, value, ttl))
 
     def append_delete(self, key):
         """
-        Writes DEL operation to WAL file.
-        Format:
-            DEL|key
+        Writes DEL operation to WAL buffer.
+        """
+        with self._lock:
+            self._f.write(self.encode_delete(key))
+
+    def append_clear(self):
+        """
+        Writes CLEAR operation to WAL buffer.
+        """
+        with self._lock:
+            self._f.write(self.encode_clear())
+
+    def append_batch(self, records):
+        """
+        Writes many encoded records to WAL buffer with a single write.
+        """
+        with self._lock:
+            self._f.write(b"".join(records))
+
+    def flush(self, fsync=False):
+        """
+        Pushes buffered records to the OS.
+        With fsync=True also forces them onto disk.
+        """
+        with self._lock:
+            self._f.flush()
+            if fsync:
+                os.fsync(self._f.fileno())
+
+    def close(self):
+        """
+        Flushes, syncs and closes the WAL file.
         """
-        with open(self.log_path, "a", encoding="utf-8") as f:
-            f.write(f"DEL|{key}\n")                 # append to WAL
+        with self._lock:
+            if self._f.closed:
+                return
+            self._f.flush()
+            os.fsync(self._f.fileno())
+            self._f.close()
 
     def size(self):
         """
-        Returns WAL file size in bytes.
+        Returns WAL size in bytes: snapshot + log (incl. buffered records).
         """
-        return os.path.getsize(self.log_path)
+        with self._lock:
+            return self._snapshot_size + self._f.tell()
 
     def recover(self, store):
         """
         Reads WAL file and rebuilds store state.
         This is called when server starts.
         """
-        if not os.path.exists(self.log_path):
+        # Replay all operations into a plain dict first, so overwritten
+        # and deleted keys never reach the store
+        entries = {}
+
+        # Load compacted snapshot first
+        self._recover_snapshot(entries)
+
+        legacy = False
+        if os.path.exists(self.log_path):
+            legacy = self._recover_log(entries)
+
+        # Load final state into the store in one go
+        store.bulk_load(
+            (key, value, ttl) for key, (value, ttl) in entries.items()
+        )
+
+        # Old text WAL -> rewrite it in the binary format
+        if legacy:
+            self.compact(store)
+
+    def _recover_log(self, entries):
+        """
+        Reads the log file into entries and drops a damaged tail.
+        Returns True if the log was in the old text format.
+        """
+        # Make sure buffered records are visible to the reader
+        self.flush()
+
+        with open(self.log_path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+
+            # mmap cannot map an empty file
+            if size == 0:
+                return False
+
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                legacy = buf[:4] in LEGACY_PREFIXES
+
+                valid_end = 0
+                if not legacy:
+                    valid_end = _replay(buf, entries)
+
+        # Old text WAL -> parse it with the old reader
+        if legacy:
+            self._recover_legacy_text(entries)
+            return True
+
+        # Drop a damaged tail so new records follow the last good frame
+        if valid_end < size:
+            with self._lock:
+                self._f.close()
+                os.truncate(self.log_path, valid_end)
+                self._f = self._open()
+
+        return False
+
+    def _recover_snapshot(self, entries):
+        """
+        Loads the snapshot written by compact() (gzip, or plain frames).
+        """
+        if not os.path.exists(self.snapshot_path):
             return
 
+        with open(self.snapshot_path, "rb") as f:
+            compressed = f.read(2) == GZIP_MAGIC
+            f.seek(0)
+
+            if compressed:
+                with gzip.GzipFile(fileobj=f) as gz:
+                    buf = gz.read()
+            else:
+                buf = f.read()
+
+        _replay(buf, entries)
+
+    def _recover_legacy_text(self, entries):
+        """
+        Reads an old pipe-delimited text WAL (SET|key|value|ttl, DEL|key).
+        """
         with open(self.log_path, "r", encoding="utf-8") as f:
             for line in f:
                 line = line.strip()
@@ -74,26 +305,40 @@ class WAL:
                     # Convert ttl back to int or None
                     ttl = None if ttl == "None" else int(ttl)
 
-                    # Restore into store
-                    store.set(key, value, ttl=ttl)
+                    # Restore into entries
+                    entries.pop(key, None)
+                    entries[key] = (value, ttl)
 
                 # DELETE recovery
                 elif parts[0] == "DEL":
                     key = parts[1]
-                    store.delete(key)
+                    entries.pop(key, None)
 
     def compact(self, store):
         """
-        Removes old WAL history by rewriting WAL using only live keys.
+        Removes old WAL history: writes live keys into a gzip snapshot
+        and empties the log.
         """
-        tmp_path = self.log_path + ".tmp"
+        tmp_path = self.snapshot_path + ".tmp"
+
+        with self._lock:
+            # Write new snapshot file
+            with open(tmp_path, "wb") as raw:
+                with gzip.GzipFile(fileobj=raw, mode="wb",
+                                   compresslevel=SNAPSHOT_COMPRESSLEVEL) as f:
+                    # one consistent view of live keys (no metrics/LRU)
+                    for key, value, ttl in store.items_with_ttl():
+                        f.write(self.encode_set(key, value, ttl))
+                raw.flush()
+                os.fsync(raw.fileno())
 
-        # Write new WAL file
-        with open(tmp_path, "w", encoding="utf-8") as f:
-            for key in store.keys():
-                value = store.get(key)              # get current value
-                ttl = store.ttl_remaining(key)      # get TTL remaining
-                f.write(f"SET|{key}|{value}|{ttl}\n")
+            # Replace old snapshot with new one
+            os.replace(tmp_path, self.snapshot_path)
+            self._snapshot_size = os.path.getsize(self.snapshot_path)
 
-        # Replace old WAL with new compacted one
-        os.replace(tmp_path, self.log_path)
+            # Snapshot now holds everything -> start an empty log.
+            # (a crash before this point only replays the old log on top
+            #  of the snapshot, which ends in the same state)
+            self._f.close()
+            open(self.log_path, "wb").close()
+            self._f = self._open()
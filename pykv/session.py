@@ -0,0 +1,109 @@
+# ============================ session.py ============================
+# This file provides the session middleware used by main.py.
+# It is Starlette's signed-cookie SessionMiddleware, but remembers
+# cookies that were already verified (or signed by us), so the HMAC
+# check does not run again on every request with the same cookie, and
+# re-uses a recent cookie when the session did not change instead of
+# signing a new one on every response.
+# ====================================================================
+
+import time                            # Used to check cookie age
+from collections import OrderedDict   # Used as LRU cache of cookies
+
+import itsdangerous                    # Same signer Starlette uses
+from itsdangerous.exc import SignatureExpired
+from starlette.middleware.sessions import SessionMiddleware
+
+
+class CachingSigner:
+    """
+    TimestampSigner wrapper with two LRU caches:
+    - signed cookie bytes -> (payload, signed_at)   (skips verify HMAC)
+    - payload -> (newest signed cookie, signed_at)  (skips sign HMAC)
+    Only valid signatures are cached, so a bad cookie is always
+    rejected by the real signer.
+    """
+    def __init__(self, secret_key, maxsize=4096, reuse_for=60):
+        self._signer = itsdangerous.TimestampSigner(str(secret_key))
+        self.maxsize = maxsize
+
+        # A cookie younger than this (seconds) is sent again unchanged
+        # for the same session data. Sessions still slide forward, just
+        # in steps of reuse_for instead of on every response.
+        self.reuse_for = reuse_for
+
+        # Only used from the event loop thread -> no lock needed
+        self._cache = OrderedDict()
+        self._latest = OrderedDict()
+
+    def _remember(self, signed, value, signed_at):
+        """
+        Adds a verified cookie to the caches (drops the oldest if full)
+        """
+        self._cache[signed] = (value, signed_at)
+        self._cache.move_to_end(signed)
+
+        if len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+
+        # Keep the newest cookie for this session data
+        latest = self._latest.get(value)
+        if latest is None or latest[1] <= signed_at:
+            self._latest[value] = (signed, signed_at)
+            self._latest.move_to_end(value)
+
+            if len(self._latest) > self.maxsize:
+                self._latest.popitem(last=False)
+
+    def sign(self, value):
+        """
+        Signs session data. If the same data was signed (or arrived in
+        a verified cookie) less than reuse_for seconds ago, that cookie
+        is returned instead of computing a new HMAC.
+        """
+        now = time.time()
+
+        latest = self._latest.get(value)
+        if latest is not None and now - latest[1] < self.reuse_for:
+            return latest[0]
+
+        # New cookie is cached right away: the browser sends it back
+        signed = self._signer.sign(value)
+        self._remember(signed, value, int(now))
+        return signed
+
+    def unsign(self, signed, max_age=None):
+        """
+        Returns session data of a signed cookie.
+        Raises BadSignature (or SignatureExpired) like TimestampSigner.
+        """
+        hit = self._cache.get(signed)
+
+        # Not seen before -> full HMAC check, then cache it
+        if hit is None:
+            value, ts = self._signer.unsign(
+                signed, max_age=max_age, return_timestamp=True
+            )
+            self._remember(signed, value, ts.timestamp())
+            return value
+
+        value, signed_at = hit
+
+        # Cached cookies still have to respect the session max age
+        if max_age is not None and time.time() - signed_at > max_age:
+            del self._cache[signed]
+            raise SignatureExpired("Signature age > max_age", payload=value)
+
+        self._cache.move_to_end(signed)
+        return value
+
+
+class CachedSessionMiddleware(SessionMiddleware):
+    """
+    SessionMiddleware that uses CachingSigner for its cookies.
+    Changing secret_key invalidates all sessions (and the cache is
+    per process, so a restart empties it).
+    """
+    def __init__(self, app, secret_key, cache_size=4096, reuse_for=60, **kwargs):
+        super().__init__(app, secret_key, **kwargs)
+        self.signer = CachingSigner(secret_key, maxsize=cache_size, reuse_for=reuse_for)
@@ -2,57 +2,71 @@
 # This file implements the MAIN IN-MEMORY KEY VALUE STORE.
 # Key features:
 # 1) O(1) GET/SET/DELETE using hash map
-# 2) LRU eviction using doubly linked list
-# 3) TTL expiration (lazy + background cleanup)
+# 2) LRU eviction using OrderedDict (insertion order = LRU order)
+# 3) TTL expiration (lazy + background cleanup driven by a min-heap)
 # 4) Metrics tracking (hits, misses, uptime etc.)
 # ================================================================
 
+import array       # Used for compact metric counters
+import heapq       # Used as priority queue of expiry times
 import time        # Used for TTL and uptime
 import threading   # Used for background TTL cleanup
+from collections import OrderedDict   # C implemented ordered hash map
 
+# Expiries are stored as integer nanoseconds (time.monotonic_ns)
+NS_PER_SECOND = 1_000_000_000
 
-class Node:
+# Longest TTL accepted (10 years); longer TTLs are clamped to this
+MAX_TTL_SECONDS = 10 * 365 * 24 * 3600
+
+# Longest the cleanup thread sleeps in one wait (seconds); very long
+# TTLs would otherwise overflow Condition.wait's timeout
+MAX_CLEANUP_WAIT = 60
+
+# Metric counter slots in PyKVStore._counters
+OPS, HITS, MISSES, EVICT, TTL_EXP = range(5)
+
+# Marker for "key not present" (stored values may themselves be None)
+_MISSING = object()
+
+
+def _ttl_ns(ttl):
     """
-    Doubly linked list node used for LRU cache.
-    Each node stores one key-value pair.
+    Converts TTL seconds to nanoseconds, clamped to MAX_TTL_SECONDS
+    (so huge or infinite float TTLs cannot overflow int conversion)
     """
-    def __init__(self, key, value, expiry=None):
-        self.key = key            # Stores the key
-        self.value = value        # Stores the value
-        self.expiry = expiry      # Stores expiration timestamp for TTL
-
-        self.prev = None          # Pointer to previous node
-        self.next = None          # Pointer to next node
+    return int(min(ttl, MAX_TTL_SECONDS) * NS_PER_SECOND)
 
 
 class PyKVStore:
     """
     In-memory KV store using:
-    - Hash map for O(1) access
-    - Doubly linked list for LRU order
-    - TTL support
+    - OrderedDict for O(1) access + LRU order
+      (first item = least recently used, last item = most recently used)
+    - Separate expiry dict for TTL support (only keys with a TTL)
     """
     def __init__(self, capacity=1000):
         # Maximum allowed keys in the store
         self.capacity = capacity
 
-        # Dict to map key -> node (fast lookup)
-        self.map = {}
+        # Ordered dict: key -> value
+        self.map = OrderedDict()
 
-        # Create dummy head and tail nodes for LRU list
-        self.head = Node(None, None)   # head.next = most recently used key
-        self.tail = Node(None, None)   # tail.prev = least recently used key
+        # Dict: key -> expiry time in ns (time.monotonic_ns), TTL keys only
+        self.expiries = {}
 
-        # Connect head and tail
-        self.head.next = self.tail
-        self.tail.prev = self.head
+        # Min-heap of (expiry, key) so cleanup only looks at the earliest
+        # expiry. Entries are removed lazily: an entry whose key is gone
+        # or has a different expiry now is simply skipped.
+        self._ttl_heap = []
+
+        # Lock for all store changes + wakes cleanup thread on new TTLs
+        self._cond = threading.Condition()
 
         # ---------- METRICS ----------
-        self.total_ops = 0
-        self.cache_hits = 0
-        self.cache_misses = 0
-        self.evictions = 0
-        self.ttl_expirations = 0
+        # One signed 64-bit slot per metric (ops, hits, misses,
+        # evictions, ttl expirations), only changed under self._cond
+        self._counters = array.array("q", [0] * 5)
         self.start_time = time.time()   # Used to calculate uptime
 
         # Background thread stop flag
@@ -65,75 +79,56 @@ class PyKVStore:
         )
         self.cleanup_thread.start()
 
-    # ------------------- LRU INTERNAL METHODS -------------------
-
-    def _add_to_front(self, node: Node):
-        """
-        Adds node right after head => Most recently used
-        """
-        node.next = self.head.next            # node points to old first node
-        node.prev = self.head                 # node.prev becomes head
-        self.head.next.prev = node            # old first node prev becomes node
-        self.head.next = node                 # head.next becomes node
-
-    def _remove_node(self, node: Node):
-        """
-        Removes node from doubly linked list
-        """
-        node.prev.next = node.next            # skip node forward
-        node.next.prev = node.prev            # skip node backward
-
-    def _move_to_front(self, node: Node):
-        """
-        Marks node as recently used by moving it to front
-        """
-        self._remove_node(node)               # remove from current position
-        self._add_to_front(node)              # add again to front
+    # ------------------- TTL METHODS -------------------
 
-    def _evict_lru(self):
+    def _push_expiry(self, key, expiry):
         """
-        Removes least recently used item when capacity exceeded
+        Adds key expiry to heap and wakes cleanup thread if it is the
+        new earliest expiry (caller holds self._cond)
         """
-        lru = self.tail.prev                  # last real node is LRU
-
-        # If store is empty (only dummy nodes)
-        if lru == self.head:
-            return
+        heapq.heappush(self._ttl_heap, (expiry, key))
 
-        # Remove lru node from list and dict
-        self._remove_node(lru)
-        self.map.pop(lru.key, None)
+        # Rebuild heap when it is mostly stale entries
+        if len(self._ttl_heap) > 2 * len(self.expiries) + 64:
+            self._rebuild_ttl_heap()
 
-        # Increase eviction counter
-        self.evictions += 1
+        if self._ttl_heap[0] == (expiry, key):
+            self._cond.notify()
 
-    # ------------------- TTL METHODS -------------------
-
-    def _is_expired(self, node: Node) -> bool:
+    def _rebuild_ttl_heap(self):
         """
-        Checks if the key is expired (TTL over)
+        Recreates heap from live expiries (caller holds self._cond)
         """
-        return node.expiry is not None and time.time() >= node.expiry
+        self._ttl_heap = [(expiry, k) for k, expiry in self.expiries.items()]
+        heapq.heapify(self._ttl_heap)
 
     def _ttl_cleanup_loop(self):
         """
-        Background thread which deletes expired keys regularly
+        Background thread which deletes keys as soon as they expire
         """
-        while not self._stop:
-            time.sleep(2)                     # run cleanup every 2 seconds
-            now = time.time()                 # current timestamp
+        heappop = heapq.heappop
+
+        with self._cond:
+            while not self._stop:
+                now = time.monotonic_ns()     # current time in ns
 
-            expired_keys = []
+                # Delete every key whose expiry time has passed
+                while self._ttl_heap and self._ttl_heap[0][0] <= now:
+                    expiry, k = heappop(self._ttl_heap)
 
-            # Scan all keys and find expired ones
-            for k, node in list(self.map.items()):
-                if node.expiry is not None and now >= node.expiry:
-                    expired_keys.append(k)
+                    # Skip stale entry (key deleted or TTL changed)
+                    if self.expiries.get(k) != expiry:
+                        continue
 
-            # Delete all expired keys
-            for k in expired_keys:
-                self.ttl_expirations += 1     # increase expiry counter
-                self.delete(k, reason="ttl")  # delete key from store
+                    self._counters[TTL_EXP] += 1  # increase expiry counter
+                    self.delete(k, reason="ttl")  # delete key from store
+
+                # Sleep until next expiry (or until set() notifies us)
+                timeout = None
+                if self._ttl_heap:
+                    timeout = (self._ttl_heap[0][0] - now) / NS_PER_SECOND
+                    timeout = min(timeout, MAX_CLEANUP_WAIT)
+                self._cond.wait(timeout)
 
     # ------------------- PUBLIC STORE METHODS -------------------
 
@@ -143,35 +138,61 @@ class PyKVStore:
         - Insert or update key value
         - Add TTL if given
         """
-        self.total_ops += 1                   # update operation count
-
-        # Convert TTL seconds to absolute expiry timestamp
-        expiry = None
-        if ttl is not None:
-            expiry = time.time() + ttl
-
-        # If key already exists: update value
-        if key in self.map:
-            node = self.map[key]              # get node
-            node.value = value                # update value
-            node.expiry = expiry              # update expiry
-            self._move_to_front(node)         # mark as recently used
-            return True
-
-        # If store full: evict LRU
-        if len(self.map) >= self.capacity:
-            self._evict_lru()
+        with self._cond:
+            self._counters[OPS] += 1       # update operation count
+
+            # Convert TTL seconds to absolute expiry time (ns)
+            if ttl is not None:
+                expiry = time.monotonic_ns() + _ttl_ns(ttl)
+                self.expiries[key] = expiry
+                self._push_expiry(key, expiry)
+            else:
+                self.expiries.pop(key, None)
+
+            # If key already exists: update value, mark as recently used
+            if key in self.map:
+                self.map[key] = value
+                self.map.move_to_end(key)
+                return True
+
+            # If store full: evict LRU (first item)
+            if len(self.map) >= self.capacity and self.map:
+                lru_key, _ = self.map.popitem(last=False)
+                self.expiries.pop(lru_key, None)
+                self._counters[EVICT] += 1
+
+            # Insert as most recently used (last item)
+            self.map[key] = value
 
-        # Create new node
-        node = Node(key, value, expiry)
-
-        # Store in dict
-        self.map[key] = node
-
-        # Add to LRU front
-        self._add_to_front(node)
+            return True
 
-        return True
+    def bulk_load(self, entries):
+        """
+        Fast load used by WAL recovery:
+        - Replaces store contents with (key, value, ttl) entries
+        - Keys must be unique; the last entry is the most recently used
+        - Skips metrics and per-key LRU bookkeeping
+        """
+        now = time.monotonic_ns()
+
+        # Build values and expiries in one pass
+        loaded = OrderedDict()
+        expiries = {}
+        for key, value, ttl in entries:
+            loaded[key] = value
+            if ttl is not None:
+                expiries[key] = now + _ttl_ns(ttl)
+
+        # Keep only the most recent entries that fit in capacity
+        while len(loaded) > self.capacity:
+            old_key, _ = loaded.popitem(last=False)
+            expiries.pop(old_key, None)
+
+        with self._cond:
+            self.map = loaded
+            self.expiries = expiries
+            self._rebuild_ttl_heap()
+            self._cond.notify()
 
     def get(self, key):
         """
@@ -180,59 +201,84 @@ class PyKVStore:
         - Update LRU order
         - Check TTL expiration
         """
-        self.total_ops += 1
+        return self.get_with_ttl(key)[1]
+
+    def get_with_ttl(self, key):
+        """
+        GET operation that also returns remaining TTL seconds in the
+        same pass (one lookup per dict, one clock read).
+        Returns (found, value, ttl_remaining); found is False (and the
+        rest None) if key is missing or expired, so a stored None value
+        can be told apart from a miss.
+        """
+        with self._cond:
+            self._counters[OPS] += 1
 
-        node = self.map.get(key)
+            value = self.map.get(key, _MISSING)
 
-        # If key not found
-        if not node:
-            self.cache_misses += 1
-            return None
+            # If key not found
+            if value is _MISSING:
+                self._counters[MISSES] += 1
+                return False, None, None
 
-        # If key expired
-        if self._is_expired(node):
-            self.ttl_expirations += 1
-            self.delete(key, reason="ttl")
-            self.cache_misses += 1
-            return None
+            remaining = None
+            expiry = self.expiries.get(key)
+            if expiry is not None:
+                now = time.monotonic_ns()
+
+                # If key expired
+                if now >= expiry:
+                    self._counters[TTL_EXP] += 1
+                    self.delete(key, reason="ttl")
+                    self._counters[MISSES] += 1
+                    return False, None, None
+
+                remaining = (expiry - now) // NS_PER_SECOND
 
-        # Key found => update LRU
-        self._move_to_front(node)
+            # Key found => update LRU
+            self.map.move_to_end(key)
 
-        self.cache_hits += 1
-        return node.value
+            self._counters[HITS] += 1
+            return True, value, remaining
 
     def delete(self, key, reason="user"):
         """
         DELETE operation:
-        - Remove key from map + LRU list
+        - Remove key from map (and so from LRU order)
         """
-        self.total_ops += 1
+        with self._cond:
+            self._counters[OPS] += 1
 
-        node = self.map.get(key)
+            # Heap entry (if any) becomes stale and is skipped later
+            self.expiries.pop(key, None)
 
-        # If key not found
-        if not node:
-            return False
+            # pop returns _MISSING if key not found
+            return self.map.pop(key, _MISSING) is not _MISSING
 
-        # Remove from list and dict
-        self._remove_node(node)
-        self.map.pop(key, None)
+    def clear_all(self):
+        """
+        CLEAR operation:
+        - Remove every key in one step
+        """
+        with self._cond:
+            self._counters[OPS] += 1
 
-        return True
+            self.map = OrderedDict()
+            self.expiries = {}
+            self._ttl_heap = []
 
     def ttl_remaining(self, key):
         """
         Returns remaining TTL seconds for the key
         """
-        node = self.map.get(key)
+        expiry = self.expiries.get(key)
 
         # If key not found or no TTL
-        if not node or node.expiry is None:
+        if expiry is None:
             return None
 
         # Calculate remaining seconds
-        remaining = int(node.expiry - time.time())
+        remaining = (expiry - time.monotonic_ns()) // NS_PER_SECOND
 
         # Never return negative values
         return max(0, remaining)
@@ -243,25 +289,60 @@ class PyKVStore:
         """
         uptime = int(time.time() - self.start_time)
 
+        # Copy counters under the lock so the numbers agree with each other
+        with self._cond:
+            counters = self._counters.tolist()
+
         return {
             "total_keys": len(self.map),
-            "total_ops": self.total_ops,
-            "cache_hits": self.cache_hits,
-            "cache_misses": self.cache_misses,
-            "evictions": self.evictions,
-            "ttl_expirations": self.ttl_expirations,
+            "total_ops": counters[OPS],
+            "cache_hits": counters[HITS],
+            "cache_misses": counters[MISSES],
+            "evictions": counters[EVICT],
+            "ttl_expirations": counters[TTL_EXP],
             "uptime_seconds": uptime,
             "wal_file_size": wal_size,
         }
 
+    def items_with_ttl(self):
+        """
+        Returns [(key, value, ttl_remaining_seconds or None), ...] for
+        every live key in LRU order (oldest first), taken in one pass
+        under the lock. Used by WAL compaction; skips expired keys and
+        does not touch metrics or LRU order.
+        """
+        with self._cond:
+            now = time.monotonic_ns()
+            expiries = self.expiries
+            items = []
+
+            for key, value in self.map.items():
+                expiry = expiries.get(key)
+
+                if expiry is None:
+                    items.append((key, value, None))
+                elif expiry > now:
+                    items.append((key, value, (expiry - now) / NS_PER_SECOND))
+
+            return items
+
+    def __len__(self):
+        """
+        Returns number of keys in store
+        """
+        return len(self.map)
+
     def keys(self):
         """
         Returns list of all keys in store
         """
-        return list(self.map.keys())
+        with self._cond:
+            return list(self.map.keys())
 
     def stop(self):
         """
         Stops TTL cleanup thread
         """
-        self._stop = True
+        with self._cond:
+            self._stop = True
+            self._cond.notify()